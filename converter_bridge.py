@@ -1,44 +1,70 @@
 import subprocess
 import os
 import sys
+import tempfile
 from pathlib import Path
 import json
 
 
-def convert_image_to_avif(input_path, output_path, quality=80, speed=6):
-    """調用Node.js轉換器進行AVIF轉換"""
+def _build_options(quality, speed, max_width=None, max_height=None,
+                   max_megapixels=None, fit="inside", **extra):
+    """組裝傳給Node.js轉換器的參數"""
+    options = {"quality": int(quality), "speed": int(speed), "fit": fit}
+
+    # 尺寸限制，未設置時不縮放
+    if max_width:
+        options["maxWidth"] = int(max_width)
+    if max_height:
+        options["maxHeight"] = int(max_height)
+    if max_megapixels:
+        options["maxMegapixels"] = float(max_megapixels)
+
+    options.update(extra)
+    return options
+
+
+def _run_node_script(script, script_dir):
+    """以ES模塊方式運行Node.js腳本"""
+    return subprocess.run(
+        ["node", "--input-type=module", "-e", script],
+        capture_output=True,
+        text=True,
+        cwd=script_dir,
+    )
+
+
+def convert_image_to_avif(input_path, output_path, quality=80, speed=6,
+                          max_width=None, max_height=None,
+                          max_megapixels=None, fit="inside",
+                          size_guard=False, size_guard_fallback="copy"):
+    """調用Node.js轉換器進行AVIF轉換
+
+    size_guard為True時，預計或實際無法縮小的文件不輸出AVIF，
+    按size_guard_fallback ("copy"/"link"/"none") 保留原圖，
+    返回值中skipped為True。
+    """
     try:
         # 調用我們的Node.js轉換器
         script_dir = Path(__file__).parent
         converter_path = script_dir / "src" / "converter.js"
+        options = _build_options(
+            quality, speed, max_width, max_height, max_megapixels, fit,
+            sizeGuard=bool(size_guard), sizeGuardFallback=size_guard_fallback,
+        )
 
         # 使用Node.js運行轉換
-        result = subprocess.run(
-            [
-                "node",
-                "-e",
-                f"""
-import {{ convertToAvif }} from '{converter_path}';
-import {{ fileURLToPath }} from 'url';
-import path from 'path';
-
-const __filename = fileURLToPath(import.meta.url);
-const __dirname = path.dirname(__filename);
-
-convertToAvif('{input_path}', '{output_path}', {{
-    quality: {quality},
-    speed: {speed}
-}}).then(result => {{
+        result = _run_node_script(
+            f"""
+import {{ convertToAvif }} from {json.dumps(str(converter_path))};
+
+convertToAvif({json.dumps(str(input_path))}, {json.dumps(str(output_path))}, {json.dumps(options)}).then(result => {{
     console.log(JSON.stringify(result));
 }}).catch(error => {{
     console.error('Error:', error.message);
     process.exit(1);
 }});
 """,
-            ],
-            capture_output=True,
-            text=True,
-            cwd=script_dir,
+            script_dir,
         )
 
         if result.returncode == 0:
@@ -50,40 +76,53 @@ convertToAvif('{input_path}', '{output_path}', {{
         raise Exception(f"轉換過程出錯: {str(e)}")
 
 
-def batch_convert_to_avif(input_dir, output_dir, quality=80, speed=6, concurrent=4):
-    """批量轉換目錄中的圖片到AVIF"""
+def batch_convert_to_avif(input_dir, output_dir, quality=80, speed=6, concurrent=4,
+                          max_width=None, max_height=None,
+                          max_megapixels=None, fit="inside",
+                          size_guard=False, size_guard_fallback="copy",
+                          auto_tune=False, target_throughput=None,
+                          time_budget=None, tune_sample_size=None,
+                          measure_quality=False):
+    """批量轉換目錄中的圖片到AVIF
+
+    auto_tune為True時先在樣本上測量各速度/質量組合，按目標吞吐量
+    (target_throughput，張/秒) 或總耗時 (time_budget，秒) 選擇參數，
+    選擇結果和測量表格記錄在返回值的autoTune字段中。
+    """
     try:
         script_dir = Path(__file__).parent
         converter_path = script_dir / "src" / "batch.js"
+        options = _build_options(
+            quality, speed, max_width, max_height, max_megapixels, fit,
+            concurrent=int(concurrent),
+            sizeGuard=bool(size_guard), sizeGuardFallback=size_guard_fallback,
+            quiet=True,
+        )
+
+        # 自動調優參數
+        if auto_tune:
+            tune_options = {"measureQuality": bool(measure_quality)}
+            if target_throughput:
+                tune_options["targetThroughput"] = float(target_throughput)
+            if time_budget:
+                tune_options["timeBudget"] = float(time_budget)
+            if tune_sample_size:
+                tune_options["sampleSize"] = int(tune_sample_size)
+            options["autoTune"] = tune_options
 
         # 使用Node.js批量轉換器
-        result = subprocess.run(
-            [
-                "node",
-                "-e",
-                f"""
-import {{ batchConvert }} from '{converter_path}';
-import {{ fileURLToPath }} from 'url';
-import path from 'path';
-
-const __filename = fileURLToPath(import.meta.url);
-const __dirname = path.dirname(__dirname);
-
-batchConvert('{input_dir}', '{output_dir}', {{
-    quality: {quality},
-    speed: {speed},
-    concurrent: {concurrent}
-}}).then(result => {{
+        result = _run_node_script(
+            f"""
+import {{ batchConvert }} from {json.dumps(str(converter_path))};
+
+batchConvert({json.dumps(str(input_dir))}, {json.dumps(str(output_dir))}, {json.dumps(options)}).then(result => {{
     console.log(JSON.stringify(result));
 }}).catch(error => {{
     console.error('Error:', error.message);
     process.exit(1);
 }});
 """,
-            ],
-            capture_output=True,
-            text=True,
-            cwd=script_dir,
+            script_dir,
         )
 
         if result.returncode == 0:
@@ -95,6 +134,199 @@ batchConvert('{input_dir}', '{output_dir}', {{
         raise Exception(f"批量轉換過程出錯: {str(e)}")
 
 
+def batch_convert_files_to_avif(files, quality=80, speed=6, concurrent=4,
+                                max_width=None, max_height=None,
+                                max_megapixels=None, fit="inside",
+                                size_guard=False, size_guard_fallback="copy",
+                                on_result=None):
+    """在一次Node.js調用中並發轉換一組明確的文件
+
+    files為 (輸入路徑, 輸出路徑) 列表或清單文件路徑。每個文件完成時
+    以結果字典調用on_result，返回值為匯總信息，其中results包含
+    每個文件的結果。
+    """
+    script_dir = Path(__file__).parent
+    manifest_path = None
+    process = None
+    # stderr寫入臨時文件，避免管道寫滿時Node.js進程阻塞
+    stderr_file = tempfile.TemporaryFile("w+", encoding="utf-8")
+
+    try:
+        if isinstance(files, (str, os.PathLike)):
+            # 子進程在腳本目錄運行，清單路徑需按調用方的工作目錄解析
+            manifest = os.path.abspath(files)
+        else:
+            # 寫入臨時清單文件，避免命令行參數過長
+            entries = [
+                {
+                    "input": os.path.abspath(input_path),
+                    "output": os.path.abspath(output_path),
+                }
+                for input_path, output_path in files
+            ]
+            with tempfile.NamedTemporaryFile(
+                "w", suffix=".json", delete=False, encoding="utf-8"
+            ) as f:
+                json.dump(entries, f, ensure_ascii=False)
+                manifest_path = f.name
+            manifest = manifest_path
+
+        command = [
+            "node",
+            str(script_dir / "src" / "index.js"),
+            "batch-list",
+            manifest,
+            "--json",
+            "--quality", str(int(quality)),
+            "--speed", str(int(speed)),
+            "--concurrent", str(int(concurrent)),
+            "--fit", fit,
+        ]
+        if max_width:
+            command += ["--max-width", str(int(max_width))]
+        if max_height:
+            command += ["--max-height", str(int(max_height))]
+        if max_megapixels:
+            command += ["--max-megapixels", str(float(max_megapixels))]
+        if size_guard:
+            command += ["--size-guard", "--size-guard-fallback", size_guard_fallback]
+
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            text=True,
+            cwd=script_dir,
+        )
+
+        results = []
+        summary = None
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            if event.get("type") == "result":
+                event.pop("type")
+                results.append(event)
+                if on_result:
+                    on_result(event)
+            elif event.get("type") == "summary":
+                event.pop("type")
+                summary = event
+
+        process.wait()
+
+        if process.returncode != 0 or summary is None:
+            stderr_file.seek(0)
+            raise Exception(f"批量轉換失敗: {stderr_file.read()}")
+
+        summary["results"] = results
+        return summary
+
+    except Exception as e:
+        raise Exception(f"批量轉換過程出錯: {str(e)}")
+
+    finally:
+        # on_result拋出異常等提前退出時終止Node.js進程
+        if process is not None:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+        stderr_file.close()
+        if manifest_path:
+            Path(manifest_path).unlink(missing_ok=True)
+
+
+def watch_convert_to_avif(input_dir, output_dir, quality=80, speed=6, concurrent=4,
+                          max_width=None, max_height=None,
+                          max_megapixels=None, fit="inside",
+                          size_guard=False, size_guard_fallback="copy",
+                          debounce_ms=500, initial_scan=True,
+                          stats_interval=30, on_event=None):
+    """監聽目錄並持續把新增或修改的圖片轉換為AVIF
+
+    每個事件 (converted/skipped/failed/stats) 以字典形式傳給on_event，
+    stats事件包含吞吐量和延遲統計。阻塞直到進程退出或收到
+    KeyboardInterrupt，返回最後一次統計。
+    """
+    script_dir = Path(__file__).parent
+    command = [
+        "node",
+        str(script_dir / "src" / "index.js"),
+        "watch",
+        # 子進程在腳本目錄運行，相對路徑需按調用方的工作目錄解析
+        os.path.abspath(input_dir),
+        os.path.abspath(output_dir),
+        "--json",
+        "--quality", str(int(quality)),
+        "--speed", str(int(speed)),
+        "--concurrent", str(int(concurrent)),
+        "--fit", fit,
+        "--debounce", str(int(debounce_ms)),
+        "--stats-interval", str(stats_interval),
+    ]
+    if max_width:
+        command += ["--max-width", str(int(max_width))]
+    if max_height:
+        command += ["--max-height", str(int(max_height))]
+    if max_megapixels:
+        command += ["--max-megapixels", str(float(max_megapixels))]
+    if not initial_scan:
+        command.append("--no-initial-scan")
+    if size_guard:
+        command += ["--size-guard", "--size-guard-fallback", size_guard_fallback]
+
+    last_stats = None
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=sys.stderr,
+        text=True,
+        cwd=script_dir,
+    )
+
+    try:
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            if event.get("type") == "stats":
+                last_stats = event
+            if on_event:
+                on_event(event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # 讓Node.js進程完成進行中的轉換並輸出最終統計
+        if process.poll() is None:
+            process.terminate()
+        try:
+            remaining, _ = process.communicate(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            remaining, _ = process.communicate()
+
+        for line in (remaining or "").splitlines():
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event.get("type") == "stats":
+                last_stats = event
+            if on_event:
+                on_event(event)
+
+    if process.returncode not in (0, -15) and last_stats is None:
+        raise Exception(f"監聽轉換失敗: 進程退出碼 {process.returncode}")
+
+    return last_stats
+
+
 def get_image_info(image_path):
     """獲取圖片基本信息"""
     try:
@@ -1,38 +1,59 @@
 import zipfile
 import tempfile
 import shutil
+import hashlib
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import time
 
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 所有會話共用的縮略圖線程池，線程數不隨會話增長
+_thumbnail_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnail")
+
 
 class DownloadUtils:
     """下載工具類"""
 
     @staticmethod
-    def create_download_zip(output_dir, zip_name="converted_images.zip"):
-        """創建包含轉換後文件的ZIP壓縮包"""
+    def list_output_files(output_path):
+        """列出輸出目錄中的文件，包括因無法縮小而保留的原圖"""
+        return [f for f in Path(output_path).glob("**/*") if f.is_file()]
+
+    @staticmethod
+    def create_download_zip(output_dir, zip_name="converted_images.zip", target_dir=None):
+        """創建包含轉換後文件的ZIP壓縮包，target_dir為空時寫入系統臨時目錄"""
         try:
             output_path = Path(output_dir)
             if not output_path.exists():
                 return None
 
-            # 查找所有AVIF文件
-            avif_files = list(output_path.glob("**/*.avif"))
+            # 查找所有輸出文件
+            output_files = DownloadUtils.list_output_files(output_path)
 
-            if not avif_files:
+            if not output_files:
                 return None
 
-            # 創建臨時ZIP文件
-            temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-            temp_zip.close()
+            # 創建ZIP文件
+            if target_dir:
+                zip_path = Path(target_dir) / zip_name
+            else:
+                temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
+                temp_zip.close()
+                zip_path = Path(temp_zip.name)
 
-            with zipfile.ZipFile(temp_zip.name, "w", zipfile.ZIP_DEFLATED) as zipf:
-                for avif_file in avif_files:
+            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+                for output_file in output_files:
                     # 計算相對路徑以保持目錄結構
-                    arcname = avif_file.relative_to(output_path)
-                    zipf.write(avif_file, arcname)
+                    arcname = output_file.relative_to(output_path)
+                    zipf.write(output_file, arcname)
 
-            return temp_zip.name
+            return str(zip_path)
 
         except Exception as e:
             print(f"創建ZIP文件失敗: {str(e)}")
@@ -43,17 +64,17 @@ class DownloadUtils:
         """獲取轉換後文件列表"""
         try:
             output_path = Path(output_dir)
-            avif_files = list(output_path.glob("**/*.avif"))
+            output_files = DownloadUtils.list_output_files(output_path)
 
             file_list = []
-            for avif_file in avif_files:
-                relative_path = avif_file.relative_to(output_path)
-                file_size = avif_file.stat().st_size
+            for output_file in output_files:
+                relative_path = output_file.relative_to(output_path)
+                file_size = output_file.stat().st_size
 
                 file_list.append(
                     {
                         "path": str(relative_path),
-                        "name": avif_file.name,
+                        "name": output_file.name,
                         "size": file_size,
                         "size_kb": file_size / 1024,
                     }
@@ -70,21 +91,21 @@ class DownloadUtils:
         """獲取轉換摘要信息"""
         try:
             output_path = Path(output_dir)
-            avif_files = list(output_path.glob("**/*.avif"))
+            output_files = DownloadUtils.list_output_files(output_path)
 
-            if not avif_files:
+            if not output_files:
                 return None
 
-            total_size = sum(f.stat().st_size for f in avif_files)
+            total_size = sum(f.stat().st_size for f in output_files)
             total_size_mb = total_size / (1024 * 1024)
 
             # 統計目錄結構
             directories = set()
-            for f in avif_files:
+            for f in output_files:
                 directories.add(f.parent.relative_to(output_path))
 
             return {
-                "file_count": len(avif_files),
+                "file_count": len(output_files),
                 "total_size_mb": total_size_mb,
                 "directory_count": len(directories),
                 "directories": list(directories),
@@ -95,6 +116,66 @@ class DownloadUtils:
             return None
 
 
+class ThumbnailCache:
+    """在後台線程生成並緩存小縮略圖"""
+
+    def __init__(self, cache_dir, size=96):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.size = size
+        self._pending = {}
+        self._failed = set()
+
+    def _thumbnail_path(self, source):
+        """按文件路徑、修改時間和尺寸計算緩存文件名"""
+        try:
+            mtime = os.path.getmtime(source)
+        except OSError:
+            mtime = 0
+        key = f"{source}:{mtime}:{self.size}"
+        return self.cache_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg")
+
+    def _generate(self, source, target):
+        with Image.open(source) as img:
+            img.thumbnail((self.size, self.size))
+            temp_path = target.with_suffix(".tmp")
+            img.convert("RGB").save(temp_path, "JPEG", quality=70)
+            os.replace(temp_path, target)
+
+    def get(self, source):
+        """返回已生成的縮略圖路徑；未生成時提交後台任務並返回None"""
+        if Image is None or not source or source in self._failed:
+            return None
+
+        target = self._thumbnail_path(source)
+        if target.exists():
+            return str(target)
+
+        future = self._pending.get(source)
+        if future is None:
+            self._pending[source] = _thumbnail_executor.submit(self._generate, source, target)
+        elif future.done():
+            del self._pending[source]
+            if future.exception() is not None:
+                self._failed.add(source)
+            elif target.exists():
+                return str(target)
+        return None
+
+    def has_pending(self, sources):
+        """指定的文件中是否有縮略圖仍在生成或尚未取回"""
+        return any(source in self._pending for source in sources)
+
+    def clear(self):
+        """取消未開始的任務並刪除所有緩存的縮略圖"""
+        for future in self._pending.values():
+            future.cancel()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._pending = {}
+        self._failed = set()
+
+
 # Streamlit特定的UI函數
 def create_streamlit_ui():
     """創建Streamlit UI組件"""
@@ -106,30 +187,52 @@ def create_streamlit_ui():
         return None
 
 
-def show_file_preview(output_dir, max_files=10):
-    """顯示轉換後文件的預覽"""
+def show_file_preview(output_dir, max_files=10, file_list=None, thumbnail_cache=None):
+    """分頁顯示轉換後文件的預覽，只渲染當前頁，返回當前頁縮略圖的來源路徑"""
     st = create_streamlit_ui()
     if not st:
-        return
+        return []
 
     try:
-        file_list = DownloadUtils.get_file_list(output_dir)
+        if file_list is None:
+            file_list = DownloadUtils.get_file_list(output_dir)
 
         if not file_list:
             st.info("沒有轉換後的文件可預覽")
-            return
+            return []
 
         st.subheader("📋 轉換後文件預覽")
 
-        # 限制顯示的文件數量
-        display_files = file_list[:max_files]
+        total_pages = math.ceil(len(file_list) / max_files)
+        page = 1
+        if total_pages > 1:
+            page = st.number_input(
+                "頁碼",
+                min_value=1,
+                max_value=total_pages,
+                value=1,
+                step=1,
+                key="preview_page",
+            )
+
+        start = (page - 1) * max_files
+        display_files = file_list[start : start + max_files]
+        sources = []
 
-        for i, file_info in enumerate(display_files):
+        for i, file_info in enumerate(display_files, start=start):
             col1, col2, col3 = st.columns([1, 2, 1])
 
             with col1:
-                # 文件序號
-                st.write(f"**{i + 1}.**")
+                # 縮略圖優先使用原圖生成，未生成時顯示文件序號
+                thumbnail = None
+                if thumbnail_cache:
+                    source = file_info.get("source") or str(Path(output_dir) / file_info["path"])
+                    sources.append(source)
+                    thumbnail = thumbnail_cache.get(source)
+                if thumbnail:
+                    st.image(thumbnail)
+                else:
+                    st.write(f"**{i + 1}.**")
 
             with col2:
                 # 文件信息
@@ -140,12 +243,14 @@ def show_file_preview(output_dir, max_files=10):
                 # 單文件下載按鈕（需要實現）
                 st.write("📁")
 
-        # 如果文件超過顯示限制，顯示提示
-        if len(file_list) > max_files:
-            st.info(f"還有 {len(file_list) - max_files} 個文件未顯示，請使用批量下載")
+        if total_pages > 1:
+            st.caption(f"第 {page}/{total_pages} 頁，共 {len(file_list)} 個文件")
+
+        return sources
 
     except Exception as e:
         st.error(f"文件預覽失敗: {str(e)}")
+        return []
 
 
 def provide_download_link(zip_path, link_text="📥 下載轉換後的文件"):
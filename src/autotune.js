@@ -0,0 +1,187 @@
+import sharp from 'sharp';
+import { performance } from 'perf_hooks';
+import { createAvifPipeline, computeResize } from './converter.js';
+
+// 均勻抽取代表性樣本，保證結果可重現
+export function sampleFiles(files, sampleSize) {
+  if (files.length <= sampleSize) {
+    return [...files];
+  }
+
+  const step = files.length / sampleSize;
+  const sample = [];
+  for (let i = 0; i < sampleSize; i++) {
+    sample.push(files[Math.floor(i * step)]);
+  }
+  return sample;
+}
+
+// 按並發數分組處理，與批量轉換的並發方式一致
+async function runConcurrent(items, concurrent, handler) {
+  const size = Math.max(1, Number(concurrent) || 1);
+  const results = [];
+  for (let i = 0; i < items.length; i += size) {
+    const chunk = items.slice(i, i + size);
+    results.push(...await Promise.all(chunk.map(handler)));
+  }
+  return results;
+}
+
+// 計算編碼結果相對於(縮放後)原圖的PSNR
+async function measurePsnr(file, encoded, options) {
+  const source = sharp(file);
+  const metadata = await source.metadata();
+  const resizeOptions = computeResize(metadata, options);
+  if (resizeOptions) {
+    source.resize(resizeOptions);
+  }
+
+  const [reference, decoded] = await Promise.all([
+    source.removeAlpha().toColourspace('srgb').raw().toBuffer({ resolveWithObject: true }),
+    sharp(encoded).removeAlpha().toColourspace('srgb').raw().toBuffer({ resolveWithObject: true })
+  ]);
+
+  if (reference.data.length !== decoded.data.length) {
+    return null;
+  }
+
+  let squaredError = 0;
+  for (let i = 0; i < reference.data.length; i++) {
+    const diff = reference.data[i] - decoded.data[i];
+    squaredError += diff * diff;
+  }
+
+  const mse = squaredError / reference.data.length;
+  return mse === 0 ? Infinity : 10 * Math.log10((255 * 255) / mse);
+}
+
+// 在樣本上測量單個速度/質量組合
+async function measurePoint(sample, point, options) {
+  const { concurrent, measureQuality } = options;
+  const encodeOptions = { ...options, ...point };
+
+  const startTime = performance.now();
+  const encoded = await runConcurrent(sample, concurrent, async (file) => {
+    try {
+      const { pipeline } = await createAvifPipeline(file, encodeOptions);
+      return { file, buffer: await pipeline.toBuffer() };
+    } catch (error) {
+      return { file, buffer: null };
+    }
+  });
+  const seconds = (performance.now() - startTime) / 1000;
+
+  const succeeded = encoded.filter(({ buffer }) => buffer !== null);
+  const totalSize = succeeded.reduce((sum, { buffer }) => sum + buffer.length, 0);
+
+  let psnr = null;
+  if (measureQuality && succeeded.length > 0) {
+    const scores = await runConcurrent(succeeded, concurrent, ({ file, buffer }) =>
+      measurePsnr(file, buffer, encodeOptions).catch(() => null)
+    );
+    const finite = scores.filter(score => score !== null && Number.isFinite(score));
+    psnr = finite.length > 0
+      ? Number((finite.reduce((sum, score) => sum + score, 0) / finite.length).toFixed(2))
+      : null;
+  }
+
+  return {
+    speed: point.speed,
+    quality: point.quality,
+    seconds: Number(seconds.toFixed(3)),
+    throughput: Number((succeeded.length / Math.max(seconds, 1e-6)).toFixed(2)),
+    totalSize,
+    averageSize: succeeded.length > 0 ? Math.round(totalSize / succeeded.length) : 0,
+    failed: sample.length - succeeded.length,
+    psnr
+  };
+}
+
+export async function autoTune(files, options = {}) {
+  const {
+    quality = 80,
+    sampleSize = 8,
+    speeds = [2, 4, 6, 8, 9],
+    qualities = [quality],
+    targetThroughput,
+    timeBudget,
+    totalFiles = files.length,
+    concurrent = 4,
+    minPsnr
+  } = options;
+
+  if (files.length === 0) {
+    throw new Error('沒有可用於參數調優的圖片文件');
+  }
+
+  // 多個質量候選時只比較體積會總是選中最低質量，必須設置質量下限
+  if (qualities.length > 1 && !(minPsnr > 0)) {
+    throw new Error('調優多個質量候選時必須設置最低PSNR (minPsnr)');
+  }
+  const measureQuality = Boolean(options.measureQuality) || minPsnr > 0;
+
+  const tuneStart = performance.now();
+  const sample = sampleFiles(files, sampleSize);
+
+  // 樣本內並發編碼，各組合依次測量以免互相干擾計時
+  const table = [];
+  for (const q of qualities) {
+    for (const s of speeds) {
+      const row = await measurePoint(sample, { speed: Number(s), quality: Number(q) }, {
+        ...options,
+        concurrent,
+        measureQuality
+      });
+      table.push(row);
+    }
+  }
+
+  const tuningSeconds = (performance.now() - tuneStart) / 1000;
+
+  // 時間預算扣除調優本身的耗時後換算為所需吞吐量 (張/秒)
+  let requiredThroughput = null;
+  if (targetThroughput > 0) {
+    requiredThroughput = Number(targetThroughput);
+  } else if (timeBudget > 0) {
+    const remaining = Number(timeBudget) - tuningSeconds;
+    requiredThroughput = remaining > 0 ? totalFiles / remaining : Infinity;
+  }
+
+  for (const row of table) {
+    row.meetsTarget = requiredThroughput === null || row.throughput >= requiredThroughput;
+  }
+
+  const usable = table.filter(row => row.failed < sample.length);
+  if (usable.length === 0) {
+    throw new Error('參數調優失敗: 樣本圖片均無法編碼');
+  }
+
+  const meetsQuality = (row) =>
+    !(minPsnr > 0) || (row.psnr !== null && row.psnr >= minPsnr);
+
+  // 滿足吞吐量和質量要求的組合中選擇體積最小者
+  const bySize = (a, b) => a.totalSize - b.totalSize || b.throughput - a.throughput;
+  const byThroughput = (a, b) => b.throughput - a.throughput || a.totalSize - b.totalSize;
+
+  let chosen = usable.filter(row => row.meetsTarget && meetsQuality(row)).sort(bySize)[0];
+  const metTarget = chosen !== undefined;
+
+  // 無組合達標時退而選擇最快的組合
+  if (!chosen) {
+    const candidates = usable.filter(meetsQuality);
+    chosen = (candidates.length > 0 ? candidates : usable).sort(byThroughput)[0];
+  }
+
+  return {
+    speed: chosen.speed,
+    quality: chosen.quality,
+    requiredThroughput: Number.isFinite(requiredThroughput)
+      ? Number(requiredThroughput.toFixed(2))
+      : null,
+    budgetExhausted: requiredThroughput === Infinity,
+    tuningSeconds: Number(tuningSeconds.toFixed(3)),
+    metTarget,
+    sampleSize: sample.length,
+    table
+  };
+}
@@ -4,112 +4,255 @@ import { glob } from 'glob';
 import ora from 'ora';
 import chalk from 'chalk';
 import { convertToAvif } from './converter.js';
+import { autoTune } from './autotune.js';
 
-export async function batchConvert(inputDir, outputDir, options = {}) {
-  const {
-    quality = 80,
-    speed = 6,
-    pattern = '**/*.{jpg,jpeg,png,webp,gif}',
-    concurrent = 4
-  } = options;
+// 計算相對路徑以保持目錄結構
+export function getOutputPath(inputDir, outputDir, file) {
+  const relativePath = path.relative(inputDir, file);
+  return path.join(outputDir, relativePath.replace(/\.[^/.]+$/, '.avif'));
+}
 
-  // 檢查輸入目錄是否存在
+// 讀取清單文件，相對路徑以清單所在目錄為基準
+export async function loadManifest(manifestPath) {
+  let manifest;
   try {
-    await fs.access(inputDir);
+    manifest = JSON.parse(await fs.readFile(manifestPath, 'utf8'));
   } catch (error) {
-    throw new Error(`輸入目錄不存在: ${inputDir}`);
+    throw new Error(`無法讀取清單文件: ${manifestPath} (${error.message})`);
   }
 
-  // 創建輸出目錄
-  await fs.mkdir(outputDir, { recursive: true });
+  const entries = Array.isArray(manifest) ? manifest : manifest.files;
+  if (!Array.isArray(entries)) {
+    throw new Error(`清單文件格式無效: ${manifestPath}`);
+  }
 
-  // 查找所有匹配的圖片文件
-  const searchPattern = path.join(inputDir, pattern);
-  const files = await glob(searchPattern, { nodir: true });
+  const baseDir = path.dirname(path.resolve(manifestPath));
+  return normalizeJobs(entries).map(({ input, output }) => ({
+    input: path.resolve(baseDir, input),
+    output: path.resolve(baseDir, output)
+  }));
+}
 
-  if (files.length === 0) {
-    console.log(chalk.yellow('未找到匹配的圖片文件'));
-    return;
-  }
+// 支持 {input, output} 對象或 [input, output] 數組
+function normalizeJobs(entries) {
+  return entries.map((entry, index) => {
+    const [input, output] = Array.isArray(entry) ? entry : [entry?.input, entry?.output];
+    if (!input || !output) {
+      throw new Error(`第 ${index + 1} 項缺少輸入或輸出路徑`);
+    }
+    return { input, output };
+  });
+}
+
+// 並發轉換一組輸入→輸出任務並匯總結果
+async function convertJobs(jobs, options) {
+  let {
+    quality = 80,
+    speed = 6
+  } = options;
+  const {
+    concurrent = 4,
+    maxWidth,
+    maxHeight,
+    maxMegapixels,
+    fit = 'inside',
+    sizeGuard = false,
+    sizeGuardMargin,
+    sizeGuardFallback,
+    autoTune: autoTuneOptions = false,
+    quiet = false,
+    onResult
+  } = options;
+
+  const log = quiet ? () => {} : console.log;
+  const chunkSize = Math.max(1, Number(concurrent) || 1);
+
+  // 根據樣本測量結果自動選擇編碼參數
+  let tuning = null;
+  if (autoTuneOptions) {
+    const tuneSpinner = ora({
+      text: '正在調優編碼參數...',
+      color: 'blue',
+      isSilent: quiet
+    }).start();
 
-  console.log(chalk.blue(`找到 ${files.length} 個圖片文件`));
+    tuning = await autoTune(jobs.map(job => job.input), {
+      quality,
+      concurrent,
+      maxWidth,
+      maxHeight,
+      maxMegapixels,
+      fit,
+      ...(autoTuneOptions === true ? {} : autoTuneOptions)
+    });
+    quality = tuning.quality;
+    speed = tuning.speed;
+
+    tuneSpinner.succeed(`調優完成: 質量 ${quality}, 速度 ${speed}`);
+    if (!quiet) {
+      console.table(tuning.table);
+    }
+    if (tuning.budgetExhausted) {
+      log(chalk.yellow(`調優耗時 ${tuning.tuningSeconds} 秒已用完時間預算，已選擇最快的組合`));
+    } else if (!tuning.metTarget) {
+      log(chalk.yellow(`沒有組合達到目標吞吐量 ${tuning.requiredThroughput} 張/秒，已選擇最快的組合`));
+    }
+  }
 
   // 初始化進度條
   const spinner = ora({
     text: '正在轉換圖片...',
-    color: 'blue'
+    color: 'blue',
+    isSilent: quiet
   }).start();
 
   let completed = 0;
+  let skipped = 0;
   let totalOriginalSize = 0;
   let totalConvertedSize = 0;
   const errors = [];
+  const results = [];
 
   // 並發處理文件
   const chunks = [];
-  for (let i = 0; i < files.length; i += concurrent) {
-    chunks.push(files.slice(i, i + concurrent));
+  for (let i = 0; i < jobs.length; i += chunkSize) {
+    chunks.push(jobs.slice(i, i + chunkSize));
   }
 
   for (const chunk of chunks) {
-    const promises = chunk.map(async (file) => {
+    const promises = chunk.map(async ({ input, output }) => {
+      let fileResult;
       try {
-        // 計算相對路徑以保持目錄結構
-        const relativePath = path.relative(inputDir, file);
-        const outputFile = path.join(outputDir, relativePath.replace(/\.[^/.]+$/, '.avif'));
-
         // 確保輸出子目錄存在
-        const outputSubDir = path.dirname(outputFile);
+        const outputSubDir = path.dirname(output);
         await fs.mkdir(outputSubDir, { recursive: true });
 
-        const result = await convertToAvif(file, outputFile, { quality, speed });
+        const result = await convertToAvif(input, output, {
+          quality,
+          speed,
+          maxWidth,
+          maxHeight,
+          maxMegapixels,
+          fit,
+          sizeGuard,
+          sizeGuardMargin,
+          sizeGuardFallback
+        });
         
         completed++;
+        if (result.skipped) {
+          skipped++;
+        }
         totalOriginalSize += result.originalSize;
         totalConvertedSize += result.convertedSize;
 
-        spinner.text = `正在轉換圖片... (${completed}/${files.length})`;
-        
-        return result;
+        const { metadata, ...summary } = result;
+        fileResult = { input, output, success: true, ...summary };
       } catch (error) {
-        errors.push({ file, error: error.message });
+        errors.push({ file: input, error: error.message });
         completed++;
-        spinner.text = `正在轉換圖片... (${completed}/${files.length})`;
-        return null;
+        fileResult = { input, output, success: false, error: error.message };
+      }
+
+      spinner.text = `正在轉換圖片... (${completed}/${jobs.length})`;
+      if (onResult) {
+        onResult(fileResult, completed, jobs.length);
       }
+      return fileResult;
     });
 
-    await Promise.all(promises);
+    results.push(...await Promise.all(promises));
   }
 
   spinner.succeed('轉換完成');
 
   // 顯示結果統計
-  console.log(chalk.green('\n=== 轉換結果 ==='));
-  console.log(`成功轉換: ${files.length - errors.length} 個文件`);
-  console.log(`失敗: ${errors.length} 個文件`);
+  log(chalk.green('\n=== 轉換結果 ==='));
+  log(`成功轉換: ${jobs.length - errors.length} 個文件`);
+  log(`失敗: ${errors.length} 個文件`);
+  if (sizeGuard) {
+    log(`跳過 (無法縮小): ${skipped} 個文件`);
+  }
   
   if (totalOriginalSize > 0) {
     const totalCompressionRatio = ((totalOriginalSize - totalConvertedSize) / totalOriginalSize * 100).toFixed(2);
-    console.log(`原始大小: ${(totalOriginalSize / 1024 / 1024).toFixed(2)} MB`);
-    console.log(`轉換後大小: ${(totalConvertedSize / 1024 / 1024).toFixed(2)} MB`);
-    console.log(`總壓縮率: ${totalCompressionRatio}%`);
+    log(`原始大小: ${(totalOriginalSize / 1024 / 1024).toFixed(2)} MB`);
+    log(`轉換後大小: ${(totalConvertedSize / 1024 / 1024).toFixed(2)} MB`);
+    log(`總壓縮率: ${totalCompressionRatio}%`);
   }
 
   // 顯示錯誤信息
   if (errors.length > 0) {
-    console.log(chalk.red('\n=== 錯誤信息 ==='));
+    log(chalk.red('\n=== 錯誤信息 ==='));
     errors.forEach(({ file, error }) => {
-      console.log(chalk.red(`${file}: ${error}`));
+      log(chalk.red(`${file}: ${error}`));
     });
   }
 
   return {
-    total: files.length,
-    success: files.length - errors.length,
+    total: jobs.length,
+    success: jobs.length - errors.length,
     failed: errors.length,
+    skipped,
     totalOriginalSize,
     totalConvertedSize,
-    errors
+    errors,
+    results,
+    autoTune: tuning
   };
-}
\ No newline at end of file
+}
+
+export async function batchConvert(inputDir, outputDir, options = {}) {
+  const {
+    pattern = '**/*.{jpg,jpeg,png,webp,gif}',
+    quiet = false
+  } = options;
+
+  // 檢查輸入目錄是否存在
+  try {
+    await fs.access(inputDir);
+  } catch (error) {
+    throw new Error(`輸入目錄不存在: ${inputDir}`);
+  }
+
+  // 創建輸出目錄
+  await fs.mkdir(outputDir, { recursive: true });
+
+  // 查找所有匹配的圖片文件
+  const searchPattern = path.join(inputDir, pattern);
+  const files = await glob(searchPattern, { nodir: true });
+
+  if (files.length === 0) {
+    if (!quiet) {
+      console.log(chalk.yellow('未找到匹配的圖片文件'));
+    }
+    return;
+  }
+
+  if (!quiet) {
+    console.log(chalk.blue(`找到 ${files.length} 個圖片文件`));
+  }
+
+  const jobs = files.map(file => ({
+    input: file,
+    output: getOutputPath(inputDir, outputDir, file)
+  }));
+  return convertJobs(jobs, options);
+}
+
+// 按明確的輸入→輸出列表或清單文件批量轉換
+export async function batchConvertList(jobs, options = {}) {
+  const normalized = typeof jobs === 'string'
+    ? await loadManifest(jobs)
+    : normalizeJobs(jobs);
+
+  if (normalized.length === 0) {
+    throw new Error('轉換列表為空');
+  }
+
+  if (!options.quiet) {
+    console.log(chalk.blue(`共 ${normalized.length} 個圖片文件`));
+  }
+
+  return convertJobs(normalized, options);
+}
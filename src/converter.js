@@ -2,30 +2,101 @@ import sharp from 'sharp';
 import path from 'path';
 import fs from 'fs/promises';
 
-export async function convertToAvif(inputPath, outputPath, options = {}) {
+// 計算縮放參數，未超出限制時返回null
+export function computeResize(metadata, options = {}) {
   const {
-    quality = 80,
-    speed = 6
+    maxWidth,
+    maxHeight,
+    maxMegapixels,
+    fit = 'inside'
   } = options;
 
-  // 檢查輸入文件是否存在
-  try {
-    await fs.access(inputPath);
-  } catch (error) {
-    throw new Error(`輸入文件不存在: ${inputPath}`);
+  const { width, height } = metadata;
+  if (!width || !height) {
+    return null;
   }
 
-  // 確保輸出目錄存在
-  const outputDir = path.dirname(outputPath);
-  await fs.mkdir(outputDir, { recursive: true });
+  // 同時滿足所有限制的等比縮放比例
+  const scale = Math.min(
+    1,
+    maxWidth > 0 ? maxWidth / width : 1,
+    maxHeight > 0 ? maxHeight / height : 1,
+    maxMegapixels > 0 ? Math.sqrt((maxMegapixels * 1e6) / (width * height)) : 1
+  );
+
+  if (scale >= 1) {
+    return null;
+  }
+
+  let targetWidth;
+  let targetHeight;
+
+  if (fit === 'inside') {
+    targetWidth = Math.max(1, Math.floor(width * scale));
+    targetHeight = Math.max(1, Math.floor(height * scale));
+  } else {
+    // 其他模式只約束設置了上限的邊，未設置的邊交給sharp按比例計算
+    targetWidth = maxWidth > 0 ? Math.min(width, Math.floor(maxWidth)) : undefined;
+    targetHeight = maxHeight > 0 ? Math.min(height, Math.floor(maxHeight)) : undefined;
+
+    if (maxMegapixels > 0) {
+      const boxWidth = targetWidth ?? (targetHeight ? width * targetHeight / height : width);
+      const boxHeight = targetHeight ?? (targetWidth ? height * targetWidth / width : height);
+      const limit = maxMegapixels * 1e6;
+
+      if (boxWidth * boxHeight > limit) {
+        const shrink = Math.sqrt(limit / (boxWidth * boxHeight));
+        if (targetWidth === undefined && targetHeight === undefined) {
+          targetWidth = Math.max(1, Math.floor(width * shrink));
+          targetHeight = Math.max(1, Math.floor(height * shrink));
+        } else {
+          targetWidth = targetWidth && Math.max(1, Math.floor(targetWidth * shrink));
+          targetHeight = targetHeight && Math.max(1, Math.floor(targetHeight * shrink));
+        }
+      }
+    }
+  }
+
+  return {
+    width: targetWidth,
+    height: targetHeight,
+    fit,
+    withoutEnlargement: true,
+    // JPEG/WebP在解碼時直接縮小，避免完整解碼大圖
+    fastShrinkOnLoad: true
+  };
+}
+
+// 建立AVIF編碼管線，供轉換和參數調優共用
+export async function createAvifPipeline(inputPath, options = {}) {
+  const {
+    quality = 80,
+    speed = 6,
+    maxWidth,
+    maxHeight,
+    maxMegapixels,
+    fit = 'inside'
+  } = options;
 
   // 使用sharp進行轉換
-  const converter = sharp(inputPath);
-  
+  const pipeline = sharp(inputPath);
+
   // 獲取圖片信息
-  const metadata = await converter.metadata();
-  
-  // 配置AVIF輸出
+  const metadata = await pipeline.metadata();
+
+  // 超出尺寸限制時縮小
+  const resizeOptions = computeResize(metadata, { maxWidth, maxHeight, maxMegapixels, fit });
+  if (resizeOptions) {
+    pipeline.resize(resizeOptions);
+  }
+
+  pipeline.avif(getAvifOptions(metadata, { quality, speed }));
+
+  return { pipeline, metadata, resizeOptions };
+}
+
+// 配置AVIF輸出
+function getAvifOptions(metadata, { quality = 80, speed = 6 } = {}) {
   const avifOptions = {
     quality: quality,
     speed: speed,
@@ -37,20 +108,152 @@ export async function convertToAvif(inputPath, outputPath, options = {}) {
     avifOptions.chromaSubsampling = '4:4:4';
   }
 
-  await converter
-    .avif(avifOptions)
-    .toFile(outputPath);
+  return avifOptions;
+}
+
+// 預測輸出大小時試編碼的輸出區域邊長
+const GUARD_SAMPLE_SIZE = 256;
+
+// 估算輸出圖片的像素數
+function estimateOutputPixels(metadata, resizeOptions) {
+  const { width, height } = metadata;
+  if (!resizeOptions) {
+    return width * height;
+  }
+
+  // 未指定的邊按比例推算
+  const targetWidth = resizeOptions.width ?? width * resizeOptions.height / height;
+  const targetHeight = resizeOptions.height ?? height * resizeOptions.width / width;
+  return targetWidth * targetHeight;
+}
+
+// 試編碼中央區域，按像素數線性外推完整輸出大小
+// 縮略圖會把更多細節壓進每個像素而高估體積，因此按輸出的縮放比例
+// 截取原圖中央區域再縮放，使樣本的像素細節與完整輸出一致
+async function predictAvifSize(inputPath, options, metadata, outputPixels) {
+  const { width, height } = metadata;
+  const scale = Math.min(1, Math.sqrt(outputPixels / (width * height)));
+  const cropWidth = Math.min(width, Math.ceil(GUARD_SAMPLE_SIZE / scale));
+  const cropHeight = Math.min(height, Math.ceil(GUARD_SAMPLE_SIZE / scale));
+
+  const pipeline = sharp(inputPath).extract({
+    left: Math.floor((width - cropWidth) / 2),
+    top: Math.floor((height - cropHeight) / 2),
+    width: cropWidth,
+    height: cropHeight
+  });
+  if (scale < 1) {
+    pipeline.resize({
+      width: Math.max(1, Math.round(cropWidth * scale)),
+      height: Math.max(1, Math.round(cropHeight * scale)),
+      fit: 'fill'
+    });
+  }
+  pipeline.avif(getAvifOptions(metadata, options));
+
+  const { data, info } = await pipeline.toBuffer({ resolveWithObject: true });
+  return Math.round(data.length * outputPixels / (info.width * info.height));
+}
+
+// 跳過轉換時保留原圖的路徑：輸出位置加原擴展名
+export function getKeptOriginalPath(inputPath, outputPath) {
+  return outputPath.replace(/\.[^/.]+$/, '') + path.extname(inputPath);
+}
+
+// 保留原圖代替AVIF輸出，返回保留的文件路徑
+async function keepOriginal(inputPath, outputPath, mode) {
+  if (mode !== 'copy' && mode !== 'link') {
+    return null;
+  }
+
+  const keptPath = getKeptOriginalPath(inputPath, outputPath);
+  if (path.resolve(keptPath) === path.resolve(inputPath)) {
+    return keptPath;
+  }
+
+  await fs.rm(keptPath, { force: true });
+  if (mode === 'link') {
+    try {
+      await fs.link(inputPath, keptPath);
+      return keptPath;
+    } catch (error) {
+      // 跨文件系統時無法硬鏈接，退回複製
+    }
+  }
+  await fs.copyFile(inputPath, keptPath);
+  return keptPath;
+}
+
+export async function convertToAvif(inputPath, outputPath, options = {}) {
+  const {
+    sizeGuard = false,
+    sizeGuardMargin = 1.5,
+    sizeGuardFallback = 'copy'
+  } = options;
+
+  // 檢查輸入文件是否存在
+  try {
+    await fs.access(inputPath);
+  } catch (error) {
+    throw new Error(`輸入文件不存在: ${inputPath}`);
+  }
+
+  // 確保輸出目錄存在
+  const outputDir = path.dirname(outputPath);
+  await fs.mkdir(outputDir, { recursive: true });
+
+  const originalStats = await fs.stat(inputPath);
+  const { pipeline, metadata, resizeOptions } = await createAvifPipeline(inputPath, options);
+
+  // 跳過無法縮小的文件，保留原圖
+  const skip = async (skipReason, predictedSize = null) => ({
+    inputPath,
+    outputPath: await keepOriginal(inputPath, outputPath, sizeGuardFallback),
+    originalSize: originalStats.size,
+    convertedSize: originalStats.size,
+    compressionRatio: (0).toFixed(2),
+    skipped: true,
+    skipReason,
+    predictedSize,
+    metadata
+  });
+
+  if (sizeGuard) {
+    if (metadata.format === 'heif' && metadata.compression === 'av1') {
+      return skip('already-avif');
+    }
+
+    // 只對大圖試編碼，小圖直接完整編碼更省時
+    const outputPixels = estimateOutputPixels(metadata, resizeOptions);
+    if (outputPixels > 4 * GUARD_SAMPLE_SIZE * GUARD_SAMPLE_SIZE) {
+      const predictedSize = await predictAvifSize(inputPath, options, metadata, outputPixels);
+      if (predictedSize > originalStats.size * sizeGuardMargin) {
+        return skip('predicted-larger', predictedSize);
+      }
+    }
+  }
+
+  const info = await pipeline.toFile(outputPath);
 
   // 返回轉換信息
   const stats = await fs.stat(outputPath);
-  const originalStats = await fs.stat(inputPath);
-  
+
+  // 轉換後比原圖大時丟棄輸出
+  if (sizeGuard && stats.size >= originalStats.size) {
+    await fs.rm(outputPath, { force: true });
+    return skip('larger-than-source');
+  }
+
   return {
     inputPath,
     outputPath,
     originalSize: originalStats.size,
     convertedSize: stats.size,
     compressionRatio: ((originalStats.size - stats.size) / originalStats.size * 100).toFixed(2),
+    width: info.width,
+    height: info.height,
+    resized: resizeOptions !== null,
+    skipped: false,
     metadata
   };
-}
\ No newline at end of file
+}
@@ -3,11 +3,16 @@
 import { Command } from 'commander';
 import chalk from 'chalk';
 import { convertToAvif } from './converter.js';
-import { batchConvert } from './batch.js';
+import { batchConvert, batchConvertList } from './batch.js';
+import { watchConvert } from './watch.js';
 import { listSupportedFormats } from './formats.js';
 
 const program = new Command();
 
+function parseNumberList(value) {
+  return value.split(',').map(item => Number(item.trim()));
+}
+
 program
   .name('avif-converter')
   .description('本地批量AVIF圖片轉換工具')
@@ -18,13 +23,23 @@ program
   .description('轉換單個圖片到AVIF格式')
   .argument('<input>', '輸入圖片路徑')
   .argument('<output>', '輸出AVIF圖片路徑')
-  .option('-q, --quality <number>', '壓縮質量 (1-100)', '80')
-  .option('-s, --speed <number>', '編碼速度 (1-10)', '6')
+  .option('-q, --quality <number>', '壓縮質量 (1-100)', Number, 80)
+  .option('-s, --speed <number>', '編碼速度 (1-10)', Number, 6)
+  .option('--max-width <number>', '最大寬度 (像素)', Number)
+  .option('--max-height <number>', '最大高度 (像素)', Number)
+  .option('--max-megapixels <number>', '最大像素數 (百萬像素)', Number)
+  .option('--fit <mode>', '縮放模式 (inside/cover/contain/fill)', 'inside')
+  .option('--size-guard', '跳過轉換後無法縮小的文件')
+  .option('--size-guard-fallback <mode>', '跳過時保留原圖的方式 (copy/link/none)', 'copy')
   .action(async (input, output, options) => {
     try {
       console.log(chalk.blue('開始轉換...'));
-      await convertToAvif(input, output, options);
-      console.log(chalk.green('✓ 轉換完成'));
+      const result = await convertToAvif(input, output, options);
+      if (result.skipped) {
+        console.log(chalk.yellow(`- 已跳過 (${result.skipReason})，${result.outputPath ? `保留原圖: ${result.outputPath}` : '未保留輸出'}`));
+      } else {
+        console.log(chalk.green('✓ 轉換完成'));
+      }
     } catch (error) {
       console.error(chalk.red('✗ 轉換失敗:'), error.message);
       process.exit(1);
@@ -36,13 +51,44 @@ program
   .description('批量轉換圖片到AVIF格式')
   .argument('<input-dir>', '輸入目錄路徑')
   .argument('<output-dir>', '輸出目錄路徑')
-  .option('-q, --quality <number>', '壓縮質量 (1-100)', '80')
-  .option('-s, --speed <number>', '編碼速度 (1-10)', '6')
+  .option('-q, --quality <number>', '壓縮質量 (1-100)', Number, 80)
+  .option('-s, --speed <number>', '編碼速度 (1-10)', Number, 6)
   .option('-p, --pattern <pattern>', '文件匹配模式', '**/*.{jpg,jpeg,png,webp,gif}')
-  .option('-c, --concurrent <number>', '並發處理數量', '4')
+  .option('-c, --concurrent <number>', '並發處理數量', Number, 4)
+  .option('--max-width <number>', '最大寬度 (像素)', Number)
+  .option('--max-height <number>', '最大高度 (像素)', Number)
+  .option('--max-megapixels <number>', '最大像素數 (百萬像素)', Number)
+  .option('--fit <mode>', '縮放模式 (inside/cover/contain/fill)', 'inside')
+  .option('--size-guard', '跳過轉換後無法縮小的文件')
+  .option('--size-guard-fallback <mode>', '跳過時保留原圖的方式 (copy/link/none)', 'copy')
+  .option('--auto-tune', '根據樣本自動選擇速度和質量')
+  .option('--target-throughput <number>', '調優目標吞吐量 (張/秒)', Number)
+  .option('--time-budget <seconds>', '調優目標總耗時 (秒)', Number)
+  .option('--tune-sample <number>', '調優樣本數量', Number)
+  .option('--tune-speeds <list>', '調優候選速度 (逗號分隔)', parseNumberList)
+  .option('--tune-qualities <list>', '調優候選質量 (逗號分隔)', parseNumberList)
+  .option('--tune-quality-score', '調優時計算PSNR質量分數')
+  .option('--min-psnr <number>', '調優可接受的最低PSNR', Number)
   .action(async (inputDir, outputDir, options) => {
     try {
       console.log(chalk.blue('開始批量轉換...'));
+      if (options.autoTune) {
+        options.autoTune = {
+          targetThroughput: options.targetThroughput,
+          timeBudget: options.timeBudget,
+          sampleSize: options.tuneSample,
+          speeds: options.tuneSpeeds,
+          qualities: options.tuneQualities,
+          measureQuality: options.tuneQualityScore || options.minPsnr > 0,
+          minPsnr: options.minPsnr
+        };
+        // 移除未設置的項以保留默認值
+        Object.keys(options.autoTune).forEach(key => {
+          if (options.autoTune[key] === undefined) {
+            delete options.autoTune[key];
+          }
+        });
+      }
       await batchConvert(inputDir, outputDir, options);
       console.log(chalk.green('✓ 批量轉換完成'));
     } catch (error) {
@@ -51,6 +97,130 @@ program
     }
   });
 
+program
+  .command('batch-list')
+  .description('按清單文件批量轉換圖片到AVIF格式')
+  .argument('<manifest>', '清單文件路徑 (JSON: [{"input": "...", "output": "..."}])')
+  .option('-q, --quality <number>', '壓縮質量 (1-100)', Number, 80)
+  .option('-s, --speed <number>', '編碼速度 (1-10)', Number, 6)
+  .option('-c, --concurrent <number>', '並發處理數量', Number, 4)
+  .option('--max-width <number>', '最大寬度 (像素)', Number)
+  .option('--max-height <number>', '最大高度 (像素)', Number)
+  .option('--max-megapixels <number>', '最大像素數 (百萬像素)', Number)
+  .option('--fit <mode>', '縮放模式 (inside/cover/contain/fill)', 'inside')
+  .option('--size-guard', '跳過轉換後無法縮小的文件')
+  .option('--size-guard-fallback <mode>', '跳過時保留原圖的方式 (copy/link/none)', 'copy')
+  .option('--json', '以JSON行格式輸出每個文件的結果和匯總')
+  .action(async (manifest, options) => {
+    const { json, ...batchOptions } = options;
+    const emit = (type, data) => console.log(JSON.stringify({ type, ...data }));
+
+    try {
+      if (json) {
+        batchOptions.quiet = true;
+        batchOptions.onResult = (result) => emit('result', result);
+      } else {
+        console.log(chalk.blue('開始批量轉換...'));
+      }
+
+      const result = await batchConvertList(manifest, batchOptions);
+
+      if (json) {
+        const { results, ...summary } = result;
+        emit('summary', summary);
+      } else {
+        console.log(chalk.green('✓ 批量轉換完成'));
+      }
+    } catch (error) {
+      console.error(chalk.red('✗ 批量轉換失敗:'), error.message);
+      process.exit(1);
+    }
+  });
+
+program
+  .command('watch')
+  .description('監聽目錄並持續轉換新增或修改的圖片')
+  .argument('<input-dir>', '輸入目錄路徑')
+  .argument('<output-dir>', '輸出目錄路徑')
+  .option('-q, --quality <number>', '壓縮質量 (1-100)', Number, 80)
+  .option('-s, --speed <number>', '編碼速度 (1-10)', Number, 6)
+  .option('-p, --pattern <pattern>', '文件匹配模式', '**/*.{jpg,jpeg,png,webp,gif}')
+  .option('-c, --concurrent <number>', '轉換池大小', Number, 4)
+  .option('--max-width <number>', '最大寬度 (像素)', Number)
+  .option('--max-height <number>', '最大高度 (像素)', Number)
+  .option('--max-megapixels <number>', '最大像素數 (百萬像素)', Number)
+  .option('--fit <mode>', '縮放模式 (inside/cover/contain/fill)', 'inside')
+  .option('--size-guard', '跳過轉換後無法縮小的文件')
+  .option('--size-guard-fallback <mode>', '跳過時保留原圖的方式 (copy/link/none)', 'copy')
+  .option('--debounce <ms>', '文件無變化多久後視為寫入完成 (毫秒)', Number, 500)
+  .option('--no-initial-scan', '啟動時不轉換已存在的文件')
+  .option('--stats-interval <seconds>', '統計輸出間隔 (秒，0表示不輸出)', Number, 30)
+  .option('--json', '以JSON行格式輸出事件')
+  .action(async (inputDir, outputDir, options) => {
+    const { json, statsInterval, ...watchOptions } = options;
+    const emit = (type, data) => console.log(JSON.stringify({ type, ...data }));
+
+    try {
+      const watcher = await watchConvert(inputDir, outputDir, watchOptions, {
+        converted: (result) => {
+          if (json) {
+            const { metadata, ...rest } = result;
+            emit('converted', rest);
+          } else {
+            console.log(chalk.green(`✓ ${result.inputPath} (${result.compressionRatio}%, ${result.latencyMs}ms)`));
+          }
+        },
+        skipped: ({ file, outputFile, reason }) => {
+          if (json) {
+            emit('skipped', { file, outputFile, reason });
+          } else {
+            console.log(chalk.yellow(`- ${file} (跳過: ${reason})`));
+          }
+        },
+        failed: ({ file, error }) => {
+          if (json) {
+            emit('failed', { file, error });
+          } else {
+            console.error(chalk.red(`✗ ${file}: ${error}`));
+          }
+        },
+        error: (error) => {
+          console.error(chalk.red('✗ 監聽出錯:'), error.message);
+        }
+      });
+
+      const printStats = (stats) => {
+        if (json) {
+          emit('stats', stats);
+        } else {
+          console.log(chalk.blue(
+            `已轉換 ${stats.converted}，失敗 ${stats.failed}，排隊 ${stats.queued}，進行中 ${stats.active}，` +
+            `吞吐量 ${stats.recentThroughput} 張/秒，延遲 p50 ${stats.latency.p50}ms / p95 ${stats.latency.p95}ms`
+          ));
+        }
+      };
+
+      if (!json) {
+        console.log(chalk.blue(`正在監聽 ${inputDir}，按 Ctrl+C 停止`));
+      }
+
+      const timer = statsInterval > 0
+        ? setInterval(() => printStats(watcher.getStats()), statsInterval * 1000)
+        : null;
+
+      const shutdown = async () => {
+        clearInterval(timer);
+        printStats(await watcher.close());
+        process.exit(0);
+      };
+      process.on('SIGINT', shutdown);
+      process.on('SIGTERM', shutdown);
+    } catch (error) {
+      console.error(chalk.red('✗ 監聽失敗:'), error.message);
+      process.exit(1);
+    }
+  });
+
 program
   .command('formats')
   .description('列出支持的圖片格式')
@@ -0,0 +1,397 @@
+import { watch } from 'fs';
+import fs from 'fs/promises';
+import path from 'path';
+import { EventEmitter } from 'events';
+import { glob } from 'glob';
+import { minimatch } from 'minimatch';
+import { convertToAvif, getKeptOriginalPath } from './converter.js';
+import { getOutputPath } from './batch.js';
+
+// 延遲統計保留的最近樣本數
+const LATENCY_WINDOW = 1000;
+// 近期吞吐量的統計窗口 (毫秒)
+const THROUGHPUT_WINDOW = 60000;
+
+function percentile(sorted, p) {
+  if (sorted.length === 0) {
+    return 0;
+  }
+  const index = Math.min(sorted.length - 1, Math.ceil((p / 100) * sorted.length) - 1);
+  return sorted[Math.max(0, index)];
+}
+
+// file是否為dir本身或位於dir之內
+function isInside(dir, file) {
+  const relative = path.relative(dir, file);
+  return relative === '' ||
+    (relative !== '..' && !relative.startsWith('..' + path.sep) && !path.isAbsolute(relative));
+}
+
+// 輸出文件 (或體積保護保留的原圖) 存在且不早於輸入文件時無需重新轉換
+async function isUpToDate(file, outputFile) {
+  let inputStats;
+  try {
+    inputStats = await fs.stat(file);
+  } catch (error) {
+    return false;
+  }
+
+  const keptPath = getKeptOriginalPath(file, outputFile);
+  const candidates = keptPath === file ? [outputFile] : [outputFile, keptPath];
+  for (const candidate of candidates) {
+    try {
+      const outputStats = await fs.stat(candidate);
+      if (outputStats.mtimeMs >= inputStats.mtimeMs) {
+        return true;
+      }
+    } catch (error) {
+      // 該輸出不存在，繼續檢查下一個
+    }
+  }
+  return false;
+}
+
+export class FolderWatcher extends EventEmitter {
+  constructor(inputDir, outputDir, options = {}) {
+    super();
+    const {
+      concurrent = 4,
+      debounce = 500,
+      initialScan = true,
+      pattern = '**/*.{jpg,jpeg,png,webp,gif}',
+      ...convertOptions
+    } = options;
+
+    this.inputDir = path.resolve(inputDir);
+    this.outputDir = path.resolve(outputDir);
+    this.concurrent = Math.max(1, Number(concurrent) || 1);
+    this.debounce = Math.max(0, Number(debounce) || 0);
+    this.initialScan = initialScan;
+    this.pattern = pattern;
+    this.convertOptions = convertOptions;
+
+    this.watcher = null;
+    this.directoryWatchers = null;
+    this.timers = new Map();
+    this.detectedAt = new Map();
+    this.queue = [];
+    this.queued = new Set();
+    this.active = new Map();
+    this.dirty = new Set();
+    this.closed = false;
+
+    this.startedAt = Date.now();
+    this.counters = { detected: 0, converted: 0, failed: 0, skipped: 0 };
+    this.latencies = [];
+    this.completedAt = [];
+  }
+
+  async start() {
+    try {
+      await fs.access(this.inputDir);
+    } catch (error) {
+      throw new Error(`輸入目錄不存在: ${this.inputDir}`);
+    }
+    await fs.mkdir(this.outputDir, { recursive: true });
+
+    // Linux上由inotify提供事件，遞歸監聽需要Node.js 19.1+
+    try {
+      this.watcher = watch(this.inputDir, { recursive: true }, (eventType, filename) => {
+        if (filename) {
+          this.handleEvent(path.join(this.inputDir, filename.toString()));
+        }
+      });
+      this.watcher.on('error', error => this.emit('error', error));
+    } catch (error) {
+      if (error.code !== 'ERR_FEATURE_UNAVAILABLE_ON_PLATFORM') {
+        throw error;
+      }
+      // 不支持遞歸監聽時 (如打包的Node.js 18)，逐個目錄監聽
+      this.directoryWatchers = new Map();
+      await this.watchDirectory(this.inputDir);
+    }
+
+    // 補轉啟動前已存在但未轉換的文件
+    if (this.initialScan) {
+      const files = await glob(path.join(this.inputDir, this.pattern), {
+        nodir: true,
+        ignore: this.outputIgnore()
+      });
+      for (const file of files) {
+        if (this.isOutput(file)) {
+          continue;
+        }
+        if (!(await isUpToDate(file, getOutputPath(this.inputDir, this.outputDir, file)))) {
+          this.enqueue(path.resolve(file), Date.now());
+        }
+      }
+    }
+
+    this.emit('ready');
+    return this;
+  }
+
+  // 輸出目錄位於輸入目錄內時，其中的AVIF和保留的原圖不能再次觸發轉換
+  isOutput(file) {
+    return isInside(this.outputDir, path.resolve(file));
+  }
+
+  outputIgnore() {
+    return [this.outputDir, path.join(this.outputDir, '**')];
+  }
+
+  // 與啟動掃描使用相同的匹配模式
+  matchesPattern(file) {
+    const relativePath = path.relative(this.inputDir, file).split(path.sep).join('/');
+    return minimatch(relativePath, this.pattern);
+  }
+
+  async watchDirectory(dir) {
+    if (this.closed || this.directoryWatchers.has(dir) || this.isOutput(dir)) {
+      return;
+    }
+
+    const watcher = watch(dir, (eventType, filename) => {
+      if (filename) {
+        this.handleEvent(path.join(dir, filename.toString()));
+      }
+    });
+    // 目錄被刪除或移走時停止監聽
+    watcher.on('error', () => this.unwatchDirectory(dir));
+    this.directoryWatchers.set(dir, watcher);
+
+    const entries = await fs.readdir(dir, { withFileTypes: true }).catch(() => []);
+    for (const entry of entries) {
+      if (entry.isDirectory()) {
+        await this.watchDirectory(path.join(dir, entry.name));
+      }
+    }
+  }
+
+  unwatchDirectory(dir) {
+    if (!this.directoryWatchers) {
+      return;
+    }
+    for (const [watchedDir, watcher] of this.directoryWatchers) {
+      if (watchedDir === dir || watchedDir.startsWith(dir + path.sep)) {
+        watcher.close();
+        this.directoryWatchers.delete(watchedDir);
+      }
+    }
+  }
+
+  async handleEvent(target) {
+    if (this.closed || this.isOutput(target)) {
+      return;
+    }
+
+    if (this.matchesPattern(target)) {
+      this.schedule(target);
+      return;
+    }
+
+    let stats;
+    try {
+      stats = await fs.stat(target);
+    } catch (error) {
+      this.unwatchDirectory(target);
+      return;
+    }
+
+    // 移入的目錄只產生一個事件，需要掃描其中已有的文件
+    if (stats.isDirectory()) {
+      if (this.directoryWatchers) {
+        await this.watchDirectory(target);
+      }
+      await this.scanDirectory(target);
+    }
+  }
+
+  async scanDirectory(dir) {
+    const files = await glob('**/*', {
+      cwd: dir,
+      nodir: true,
+      absolute: true,
+      ignore: this.outputIgnore()
+    });
+    for (const file of files) {
+      if (!this.isOutput(file) && this.matchesPattern(file) &&
+          !(await isUpToDate(file, getOutputPath(this.inputDir, this.outputDir, file)))) {
+        this.schedule(file);
+      }
+    }
+  }
+
+  // 去抖動：文件在debounce時間內無變化才視為寫入完成
+  schedule(file) {
+    if (this.closed) {
+      return;
+    }
+
+    if (!this.detectedAt.has(file)) {
+      this.detectedAt.set(file, Date.now());
+      this.counters.detected++;
+    }
+
+    clearTimeout(this.timers.get(file));
+    this.timers.set(file, setTimeout(() => this.checkStable(file), this.debounce));
+  }
+
+  async checkStable(file) {
+    this.timers.delete(file);
+    if (this.closed) {
+      return;
+    }
+
+    let stats;
+    try {
+      stats = await fs.stat(file);
+    } catch (error) {
+      // 文件已被刪除或移走
+      this.detectedAt.delete(file);
+      return;
+    }
+
+    if (!stats.isFile()) {
+      this.detectedAt.delete(file);
+      return;
+    }
+
+    const quietFor = Date.now() - stats.mtimeMs;
+    if (quietFor < this.debounce) {
+      this.timers.set(file, setTimeout(() => this.checkStable(file), this.debounce - quietFor));
+      return;
+    }
+
+    const detectedAt = this.detectedAt.get(file) ?? Date.now();
+    this.detectedAt.delete(file);
+    this.enqueue(file, detectedAt);
+  }
+
+  enqueue(file, detectedAt, force = false) {
+    // 轉換中的文件再次變化時，完成後重新轉換
+    if (this.active.has(file)) {
+      this.dirty.add(file);
+      return;
+    }
+    if (this.queued.has(file)) {
+      return;
+    }
+
+    this.queued.add(file);
+    this.queue.push({ file, detectedAt, force });
+    this.pump();
+  }
+
+  pump() {
+    while (!this.closed && this.active.size < this.concurrent && this.queue.length > 0) {
+      const job = this.queue.shift();
+      this.queued.delete(job.file);
+      this.active.set(job.file, this.process(job));
+    }
+  }
+
+  async process({ file, detectedAt, force }) {
+    const outputFile = getOutputPath(this.inputDir, this.outputDir, file);
+
+    try {
+      if (!force && await isUpToDate(file, outputFile)) {
+        this.counters.skipped++;
+        this.emit('skipped', { file, outputFile, reason: 'up-to-date' });
+      } else {
+        const result = await convertToAvif(file, outputFile, this.convertOptions);
+        if (result.skipped) {
+          this.counters.skipped++;
+          this.emit('skipped', { file, outputFile: result.outputPath, reason: result.skipReason });
+        } else {
+          const latencyMs = Date.now() - detectedAt;
+          this.recordCompletion(latencyMs);
+          this.emit('converted', { ...result, latencyMs });
+        }
+      }
+    } catch (error) {
+      this.counters.failed++;
+      this.emit('failed', { file, error: error.message });
+    } finally {
+      this.active.delete(file);
+      if (this.dirty.delete(file)) {
+        this.enqueue(file, Date.now(), true);
+      }
+      this.pump();
+    }
+  }
+
+  recordCompletion(latencyMs) {
+    const now = Date.now();
+    this.counters.converted++;
+
+    this.latencies.push(latencyMs);
+    if (this.latencies.length > LATENCY_WINDOW) {
+      this.latencies.shift();
+    }
+
+    this.completedAt.push(now);
+    while (this.completedAt.length > 0 && now - this.completedAt[0] > THROUGHPUT_WINDOW) {
+      this.completedAt.shift();
+    }
+  }
+
+  // 吞吐量和延遲統計，用於評估轉換池大小
+  getStats() {
+    const now = Date.now();
+    const uptime = (now - this.startedAt) / 1000;
+    const recent = this.completedAt.filter(time => now - time <= THROUGHPUT_WINDOW);
+    const sorted = [...this.latencies].sort((a, b) => a - b);
+    const average = sorted.length > 0
+      ? sorted.reduce((sum, value) => sum + value, 0) / sorted.length
+      : 0;
+
+    return {
+      ...this.counters,
+      queued: this.queue.length,
+      pending: this.timers.size,
+      active: this.active.size,
+      concurrent: this.concurrent,
+      uptime: Number(uptime.toFixed(1)),
+      throughput: Number((this.counters.converted / Math.max(uptime, 1e-3)).toFixed(3)),
+      recentThroughput: Number((recent.length / Math.min(Math.max(uptime, 1e-3), THROUGHPUT_WINDOW / 1000)).toFixed(3)),
+      latency: {
+        average: Math.round(average),
+        p50: percentile(sorted, 50),
+        p95: percentile(sorted, 95),
+        max: sorted.length > 0 ? sorted[sorted.length - 1] : 0
+      }
+    };
+  }
+
+  // 停止監聽並等待進行中的轉換完成
+  async close() {
+    this.closed = true;
+    if (this.watcher) {
+      this.watcher.close();
+    }
+    if (this.directoryWatchers) {
+      for (const watcher of this.directoryWatchers.values()) {
+        watcher.close();
+      }
+      this.directoryWatchers.clear();
+    }
+    for (const timer of this.timers.values()) {
+      clearTimeout(timer);
+    }
+    this.timers.clear();
+    this.queue = [];
+    this.queued.clear();
+    await Promise.all(this.active.values());
+    return this.getStats();
+  }
+}
+
+// listeners在啟動前綁定，以免錯過啟動掃描觸發的事件
+export async function watchConvert(inputDir, outputDir, options = {}, listeners = {}) {
+  const watcher = new FolderWatcher(inputDir, outputDir, options);
+  for (const [event, listener] of Object.entries(listeners)) {
+    watcher.on(event, listener);
+  }
+  return watcher.start();
+}
@@ -1,8 +1,10 @@
 import assert from 'assert';
 import path from 'path';
 import fs from 'fs/promises';
-import { convertToAvif } from '../src/converter.js';
-import { batchConvert } from '../src/batch.js';
+import { convertToAvif, computeResize } from '../src/converter.js';
+import { batchConvert, batchConvertList } from '../src/batch.js';
+import { watchConvert } from '../src/watch.js';
+import { autoTune } from '../src/autotune.js';
 import { isFormatSupported } from '../src/formats.js';
 
 async function runTests() {
@@ -93,6 +95,276 @@ async function runTests() {
     console.log('✗ 批量轉換失敗:', error.message);
   }
 
+  // 測試4: 尺寸限制縮放
+  console.log('測試4: 尺寸限制縮放');
+  try {
+    const resizeInputPath = path.join(testDir, 'large.jpg');
+    const resizeOutputPath = path.join(outputDir, 'large.avif');
+
+    const sharp = (await import('sharp')).default;
+    await sharp({
+      create: {
+        width: 600,
+        height: 400,
+        channels: 3,
+        background: { r: 0, g: 128, b: 255 }
+      }
+    }).jpeg().toFile(resizeInputPath);
+
+    const result = await convertToAvif(resizeInputPath, resizeOutputPath, {
+      maxWidth: 300,
+      maxMegapixels: 0.03
+    });
+
+    assert.strictEqual(result.resized, true);
+    assert(result.width <= 300);
+    assert(result.width * result.height <= 30000);
+    assert.strictEqual(computeResize({ width: 100, height: 100 }, { maxWidth: 200 }), null);
+
+    // 非inside模式只限制寬度時，高度按比例計算而不是拉伸
+    const fillOptions = computeResize({ width: 6000, height: 4000 }, { maxWidth: 2000, fit: 'fill' });
+    assert.strictEqual(fillOptions.width, 2000);
+    assert.strictEqual(fillOptions.height, undefined);
+
+    const fillResult = await convertToAvif(resizeInputPath, path.join(outputDir, 'large-fill.avif'), {
+      maxWidth: 300,
+      fit: 'fill'
+    });
+    assert.strictEqual(fillResult.width, 300);
+    assert.strictEqual(fillResult.height, 200);
+
+    console.log('✓ 尺寸限制縮放通過');
+    console.log(`  輸出尺寸: ${result.width}x${result.height}\n`);
+  } catch (error) {
+    console.log('✗ 尺寸限制縮放失敗:', error.message);
+  }
+
+  // 測試5: 編碼參數自動調優
+  console.log('測試5: 編碼參數自動調優');
+  try {
+    const tuneInputDir = path.join(testDir, 'batch-input');
+    const tuneOutputDir = path.join(testDir, 'tune-output');
+
+    const result = await batchConvert(tuneInputDir, tuneOutputDir, {
+      quality: 80,
+      concurrent: 2,
+      autoTune: { speeds: [4, 8], sampleSize: 2, measureQuality: true }
+    });
+
+    assert.strictEqual(result.success, 3);
+    assert.strictEqual(result.autoTune.sampleSize, 2);
+    assert.strictEqual(result.autoTune.table.length, 2);
+    assert([4, 8].includes(result.autoTune.speed));
+    assert.strictEqual(result.autoTune.metTarget, true);
+
+    // 多個質量候選必須設置質量下限
+    await assert.rejects(
+      autoTune([path.join(tuneInputDir, 'test1.png')], { qualities: [60, 80] }),
+      /minPsnr/
+    );
+
+    console.log('✓ 編碼參數自動調優通過');
+    console.log(`  選擇速度: ${result.autoTune.speed}, 質量: ${result.autoTune.quality}\n`);
+  } catch (error) {
+    console.log('✗ 編碼參數自動調優失敗:', error.message);
+  }
+
+  // 測試6: 監聽目錄持續轉換
+  console.log('測試6: 監聽目錄持續轉換');
+  let watcher = null;
+  try {
+    const watchInputDir = path.join(testDir, 'watch-input');
+    const watchOutputDir = path.join(testDir, 'watch-output');
+    await fs.rm(watchInputDir, { recursive: true, force: true });
+    await fs.mkdir(path.join(watchInputDir, 'sub'), { recursive: true });
+
+    const converted = [];
+    watcher = await watchConvert(watchInputDir, watchOutputDir, { debounce: 200 }, {
+      converted: (result) => converted.push(result)
+    });
+
+    const sharp = (await import('sharp')).default;
+    await sharp({
+      create: {
+        width: 10,
+        height: 10,
+        channels: 3,
+        background: { r: 10, g: 200, b: 30 }
+      }
+    }).png().toFile(path.join(watchInputDir, 'sub', 'watched.png'));
+
+    // 整個目錄移入時，其中已有的文件也要轉換
+    const stagingDir = path.join(testDir, 'watch-staging');
+    await fs.rm(stagingDir, { recursive: true, force: true });
+    await fs.mkdir(stagingDir, { recursive: true });
+    await fs.copyFile(path.join(testDir, 'test.png'), path.join(stagingDir, 'moved.png'));
+    await fs.rename(stagingDir, path.join(watchInputDir, 'moved'));
+
+    await new Promise(resolve => setTimeout(resolve, 2000));
+    const stats = await watcher.close();
+    watcher = null;
+
+    assert.strictEqual(converted.length, 2);
+    assert.strictEqual(stats.converted, 2);
+    await fs.access(path.join(watchOutputDir, 'sub', 'watched.avif'));
+    await fs.access(path.join(watchOutputDir, 'moved', 'moved.avif'));
+
+    // 輸出目錄位於輸入目錄內時，保留的原圖副本不能再次觸發轉換
+    const nestedInputDir = path.join(testDir, 'watch-nested');
+    const nestedOutputDir = path.join(nestedInputDir, 'avif');
+    await fs.rm(nestedInputDir, { recursive: true, force: true });
+    await fs.mkdir(nestedOutputDir, { recursive: true });
+    await fs.copyFile(path.join(testDir, 'test.png'), path.join(nestedOutputDir, 'old.png'));
+
+    watcher = await watchConvert(nestedInputDir, nestedOutputDir, { debounce: 200, sizeGuard: true });
+    // 1x1的PNG轉換後比原圖大，原圖被複製到輸出目錄
+    await fs.copyFile(path.join(testDir, 'test.png'), path.join(nestedInputDir, 'small.png'));
+
+    await new Promise(resolve => setTimeout(resolve, 2000));
+    const nestedStats = await watcher.close();
+    watcher = null;
+
+    assert.strictEqual(nestedStats.skipped, 1);
+    assert.strictEqual(nestedStats.converted, 0);
+    await fs.access(path.join(nestedOutputDir, 'small.png'));
+    await assert.rejects(fs.access(path.join(nestedOutputDir, 'avif')));
+
+    console.log('✓ 監聽目錄持續轉換通過');
+    console.log(`  延遲: ${stats.latency.max}ms\n`);
+  } catch (error) {
+    console.log('✗ 監聽目錄持續轉換失敗:', error.message);
+  } finally {
+    // 未關閉的監聽器會讓進程無法退出
+    if (watcher) {
+      await watcher.close();
+    }
+  }
+
+  // 測試7: 體積保護
+  console.log('測試7: 體積保護');
+  try {
+    const guardInputPath = path.join(testDir, 'test.png');
+    const guardOutputPath = path.join(outputDir, 'guarded.avif');
+
+    // 已轉換的AVIF文件再次轉換時直接跳過
+    const avifInputPath = path.join(outputDir, 'test.avif');
+    const avifResult = await convertToAvif(avifInputPath, path.join(outputDir, 'again', 'test.avif'), {
+      sizeGuard: true,
+      sizeGuardFallback: 'none'
+    });
+    assert.strictEqual(avifResult.skipped, true);
+    assert.strictEqual(avifResult.skipReason, 'already-avif');
+    assert.strictEqual(avifResult.outputPath, null);
+
+    // 1x1的PNG小於AVIF容器本身，完整編碼後比原圖大，輸出被丟棄
+    const largerResult = await convertToAvif(guardInputPath, guardOutputPath, {
+      sizeGuard: true,
+      sizeGuardFallback: 'none'
+    });
+    assert.strictEqual(largerResult.skipped, true);
+    assert.strictEqual(largerResult.skipReason, 'larger-than-source');
+    assert.strictEqual(largerResult.compressionRatio, '0.00');
+    await assert.rejects(fs.access(guardOutputPath));
+
+    // 默認保留原圖副本
+    const keptResult = await convertToAvif(guardInputPath, guardOutputPath, { sizeGuard: true });
+    assert.strictEqual(keptResult.outputPath, path.join(outputDir, 'guarded.png'));
+    await fs.access(keptResult.outputPath);
+
+    // 以質量1保存的大尺寸噪聲JPEG，按質量100轉換時試編碼預測會遠大於原圖
+    const noiseWidth = 1024;
+    const noiseHeight = 768;
+    const noise = Buffer.alloc(noiseWidth * noiseHeight * 3);
+    let seed = 12345;
+    for (let i = 0; i < noise.length; i++) {
+      seed = (seed * 1103515245 + 12345) % 2147483648;
+      noise[i] = seed >> 16;
+    }
+    const noiseInputPath = path.join(testDir, 'noise.jpg');
+    const noiseOutputPath = path.join(outputDir, 'noise.avif');
+    const sharp = (await import('sharp')).default;
+    await sharp(noise, { raw: { width: noiseWidth, height: noiseHeight, channels: 3 } })
+      .jpeg({ quality: 1 })
+      .toFile(noiseInputPath);
+
+    const predictedResult = await convertToAvif(noiseInputPath, noiseOutputPath, {
+      quality: 100,
+      speed: 9,
+      sizeGuard: true,
+      sizeGuardFallback: 'none'
+    });
+    assert.strictEqual(predictedResult.skipped, true);
+    assert.strictEqual(predictedResult.skipReason, 'predicted-larger');
+    assert(predictedResult.predictedSize > predictedResult.originalSize);
+    await assert.rejects(fs.access(noiseOutputPath));
+
+    // 平滑漸變加銳利邊緣的類照片JPEG，AVIF能明顯縮小，不能被預測跳過
+    const photoWidth = 1600;
+    const photoHeight = 1200;
+    const photo = Buffer.alloc(photoWidth * photoHeight * 3);
+    for (let y = 0; y < photoHeight; y++) {
+      for (let x = 0; x < photoWidth; x++) {
+        const offset = (y * photoWidth + x) * 3;
+        const edge = (Math.floor(x / 200) + Math.floor(y / 150)) % 2 === 0 ? 40 : 0;
+        photo[offset] = 100 + 60 * Math.sin(x / 37) * Math.cos(y / 53) + edge;
+        photo[offset + 1] = 120 + 50 * Math.sin((x + y) / 71) + edge;
+        photo[offset + 2] = 110 + 40 * Math.cos(x / 97 - y / 43) - edge;
+      }
+    }
+    const photoInputPath = path.join(testDir, 'photo.jpg');
+    const photoOutputPath = path.join(outputDir, 'photo.avif');
+    await sharp(photo, { raw: { width: photoWidth, height: photoHeight, channels: 3 } })
+      .jpeg({ quality: 85 })
+      .toFile(photoInputPath);
+
+    const photoResult = await convertToAvif(photoInputPath, photoOutputPath, {
+      sizeGuard: true,
+      sizeGuardFallback: 'none'
+    });
+    assert.strictEqual(photoResult.skipped, false);
+    assert(photoResult.convertedSize < photoResult.originalSize);
+    await fs.access(photoOutputPath);
+
+    console.log('✓ 體積保護通過');
+    console.log(`  預測大小: ${predictedResult.predictedSize} bytes, 原圖: ${predictedResult.originalSize} bytes\n`);
+  } catch (error) {
+    console.log('✗ 體積保護失敗:', error.message);
+  }
+
+  // 測試8: 按列表批量轉換
+  console.log('測試8: 按列表批量轉換');
+  try {
+    const listInputDir = path.join(testDir, 'batch-input');
+    const listOutputDir = path.join(testDir, 'list-output');
+    const manifestPath = path.join(testDir, 'manifest.json');
+
+    await fs.writeFile(manifestPath, JSON.stringify([
+      { input: path.join('batch-input', 'test1.png'), output: path.join('list-output', 'a', 'one.avif') },
+      [path.join(listInputDir, 'test2.png'), path.join(listOutputDir, 'b', 'two.avif')],
+      { input: 'missing.png', output: path.join('list-output', 'missing.avif') }
+    ]));
+
+    const reported = [];
+    const result = await batchConvertList(manifestPath, {
+      concurrent: 2,
+      quiet: true,
+      onResult: (fileResult) => reported.push(fileResult)
+    });
+
+    assert.strictEqual(result.total, 3);
+    assert.strictEqual(result.success, 2);
+    assert.strictEqual(result.failed, 1);
+    assert.strictEqual(reported.length, 3);
+    assert.strictEqual(result.results[2].success, false);
+    await fs.access(path.join(listOutputDir, 'a', 'one.avif'));
+    await fs.access(path.join(listOutputDir, 'b', 'two.avif'));
+
+    console.log('✓ 按列表批量轉換通過');
+    console.log(`  成功: ${result.success}, 失敗: ${result.failed}\n`);
+  } catch (error) {
+    console.log('✗ 按列表批量轉換失敗:', error.message);
+  }
+
   console.log('所有測試完成！');
 }
 
@@ -0,0 +1,88 @@
+import hashlib
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+
+def prune_stale_workspaces(prefix, max_age=24 * 3600, keep=None):
+    """刪除系統臨時目錄中長時間未使用的會話工作目錄
+
+    活躍會話每次運行都會更新其工作目錄的修改時間，
+    超過max_age秒未更新的目錄視為已結束的會話遺留。
+    """
+    cutoff = time.time() - max_age
+    keep = Path(keep).resolve() if keep else None
+    for path in Path(tempfile.gettempdir()).glob(f"{prefix}*"):
+        try:
+            if not path.is_dir() or path.resolve() == keep:
+                continue
+            if path.stat().st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+class UploadStaging:
+    """上傳文件的磁盤暫存區
+
+    上傳內容按塊寫入磁盤，session中只保留輕量的文件句柄
+    (字典: id/name/path/size)，避免所有上傳文件常駐內存。
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else Path(tempfile.mkdtemp(prefix="avif_uploads_"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._files = {}
+
+    @staticmethod
+    def _file_id(uploaded_file):
+        """獲取上傳文件的唯一標識，用於避免重複暫存"""
+        file_id = getattr(uploaded_file, "file_id", None)
+        if file_id:
+            return str(file_id)
+        key = f"{uploaded_file.name}:{getattr(uploaded_file, 'size', '')}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def ingest(self, uploaded_file):
+        """把上傳文件分塊寫入暫存區，返回文件句柄"""
+        file_id = self._file_id(uploaded_file)
+        if file_id in self._files:
+            return self._files[file_id]
+
+        # 每個文件單獨一個子目錄，避免同名文件互相覆蓋
+        target_dir = self.root / hashlib.sha1(file_id.encode("utf-8")).hexdigest()[:16]
+        target_dir.mkdir(parents=True, exist_ok=True)
+        target_path = target_dir / Path(uploaded_file.name).name
+
+        uploaded_file.seek(0)
+        with open(target_path, "wb") as f:
+            shutil.copyfileobj(uploaded_file, f, self.CHUNK_SIZE)
+
+        handle = {
+            "id": file_id,
+            "name": target_path.name,
+            "path": str(target_path),
+            "size": target_path.stat().st_size,
+        }
+        self._files[file_id] = handle
+        return handle
+
+    def handles(self):
+        """返回所有已暫存文件的句柄"""
+        return list(self._files.values())
+
+    def __len__(self):
+        return len(self._files)
+
+    @property
+    def total_size(self):
+        return sum(handle["size"] for handle in self._files.values())
+
+    def clear(self):
+        """刪除所有已暫存的文件"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._files = {}
@@ -7,6 +7,15 @@ import time
 import threading
 import json
 
+from converter_bridge import batch_convert_files_to_avif
+from upload_staging import UploadStaging, prune_stale_workspaces
+from download_utils import (
+    DownloadUtils,
+    ThumbnailCache,
+    show_file_preview,
+    provide_download_link,
+)
+
 try:
     from PIL import Image
     import piexif
@@ -107,9 +116,63 @@ concurrent = st.sidebar.slider(
     "並發處理數", min_value=1, max_value=8, value=4, help="同時處理的圖片數量"
 )
 
+# 尺寸限制設置
+with st.sidebar.expander("📐 尺寸限制", expanded=False):
+    max_width = st.number_input(
+        "最大寬度 (px)",
+        min_value=0,
+        value=0,
+        step=100,
+        help="超出此寬度的圖片會被縮小，0表示不限制",
+    )
+    max_height = st.number_input(
+        "最大高度 (px)",
+        min_value=0,
+        value=0,
+        step=100,
+        help="超出此高度的圖片會被縮小，0表示不限制",
+    )
+    max_megapixels = st.number_input(
+        "最大像素數 (百萬)",
+        min_value=0.0,
+        value=0.0,
+        step=0.5,
+        help="超出此像素總數的圖片會被等比縮小，0表示不限制",
+    )
+    fit = st.selectbox(
+        "縮放模式",
+        options=["inside", "cover", "contain", "fill"],
+        index=0,
+        help="inside: 保持比例完整顯示；cover: 裁剪填滿；contain: 留白填滿；fill: 拉伸",
+    )
+
+# 體積保護
+size_guard = st.sidebar.checkbox(
+    "跳過無法縮小的文件",
+    value=True,
+    help="預計或實際轉換後比原圖更大時不輸出AVIF，直接保留原圖",
+)
+
 # 支持的格式
 supported_formats = [".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tiff"]
 
+# 會話工作目錄：上傳暫存、轉換輸出和縮略圖緩存都保存在磁盤上
+if "workspace" not in st.session_state or not Path(st.session_state.workspace).exists():
+    # 新會話啟動時清理已結束會話遺留的工作目錄
+    prune_stale_workspaces("avif_web_")
+    workspace = Path(tempfile.mkdtemp(prefix="avif_web_"))
+    st.session_state.workspace = str(workspace)
+    st.session_state.upload_staging = UploadStaging(workspace / "uploads")
+    st.session_state.thumbnail_cache = ThumbnailCache(workspace / "thumbnails")
+    st.session_state.uploader_key = 0
+    for key in ("output_index", "conversion_summary", "preview_page", "preview_sources"):
+        st.session_state.pop(key, None)
+
+# 標記工作目錄仍在使用，避免被其他會話清理
+os.utime(st.session_state.workspace)
+
+staging = st.session_state.upload_staging
+
 # 主界面
 col1, col2 = st.columns([1, 1])
 
@@ -122,8 +185,25 @@ with col1:
         type=["jpg", "jpeg", "png", "webp", "gif", "bmp", "tiff"],
         accept_multiple_files=True,
         help="支持多種圖片格式，可一次選擇多個文件",
+        key=f"uploader_{st.session_state.uploader_key}",
     )
 
+    if uploaded_files:
+        # 上傳內容寫入磁盤暫存區後更換上傳組件，釋放其佔用的內存
+        for uploaded_file in uploaded_files:
+            staging.ingest(uploaded_file)
+        st.session_state.uploader_key += 1
+        st.rerun()
+
+    if len(staging) > 0:
+        st.caption(
+            f"已暫存 {len(staging)} 個上傳文件 "
+            f"({staging.total_size / (1024 * 1024):.2f} MB)"
+        )
+        if st.button("清除已上傳文件", key="clear_uploads"):
+            staging.clear()
+            st.rerun()
+
     # 或者拖拽上傳目錄
     st.markdown("---")
     st.subheader("📂 選擇目錄")
@@ -164,6 +244,7 @@ with col2:
             <p>📁 總文件數: {stats.get("total", 0)}</p>
             <p>✅ 成功轉換: {stats.get("success", 0)}</p>
             <p>❌ 轉換失敗: {stats.get("failed", 0)}</p>
+            <p>⏭️ 跳過 (保留原圖): {stats.get("skipped", 0)}</p>
             <p>📦 原始大小: {stats.get("original_size_mb", 0):.2f} MB</p>
             <p>📦 轉換後大小: {stats.get("converted_size_mb", 0):.2f} MB</p>
             <p>📉 壓縮率: {stats.get("compression_ratio", 0):.2f}%</p>
@@ -189,165 +270,198 @@ col3, col4 = st.columns([2, 1])
 with col3:
     st.subheader("🚀 開始轉換")
 
-    # 檢查是否有文件要轉換
-    files_to_convert = []
-
-    if uploaded_files:
-        files_to_convert.extend(uploaded_files)
+    # 檢查是否有文件要轉換，只保存路徑和顯示名稱
+    files_to_convert = [(handle["path"], handle["name"]) for handle in staging.handles()]
 
     if "directory_files" in st.session_state:
-        files_to_convert.extend(st.session_state.directory_files)
+        files_to_convert.extend(
+            (path, os.path.basename(path)) for path in st.session_state.directory_files
+        )
 
     if files_to_convert:
         st.info(f"準備轉換 {len(files_to_convert)} 個文件")
 
         if st.button("開始轉換", type="primary", key="start_convert"):
-            # 創建臨時目錄
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_dir = Path(temp_dir)
-                output_dir = temp_dir / "output"
-                output_dir.mkdir(exist_ok=True)
-
-                # 進度條
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-
-                # 轉換統計
-                stats = {
-                    "total": len(files_to_convert),
-                    "success": 0,
-                    "failed": 0,
-                    "original_size": 0,
-                    "converted_size": 0,
-                    "errors": [],
-                }
-
-                # 實際轉換過程
-                from converter_bridge import convert_image_to_avif
-
-                for i, file_info in enumerate(files_to_convert):
-                    try:
-                        # 更新狀態
-                        filename = (
-                            file_info.name
-                            if hasattr(file_info, "name")
-                            else os.path.basename(file_info)
+            # 清空上一次的輸出
+            output_dir = Path(st.session_state.workspace) / "output"
+            shutil.rmtree(output_dir, ignore_errors=True)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            st.session_state.thumbnail_cache.clear()
+            for key in ("output_index", "conversion_summary", "preview_page", "preview_sources"):
+                st.session_state.pop(key, None)
+
+            # 進度條
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+
+            # 轉換統計
+            stats = {
+                "total": len(files_to_convert),
+                "success": 0,
+                "failed": 0,
+                "skipped": 0,
+                "original_size": 0,
+                "converted_size": 0,
+                "errors": [],
+            }
+
+            # 輸出索引，供分頁預覽使用
+            output_index = []
+
+            # 生成輸出路徑，同名文件 (如a.jpg和a.png) 加序號避免並發轉換互相覆蓋
+            jobs = []
+            used_stems = set()
+            for input_path, filename in files_to_convert:
+                stem = base_stem = Path(filename).stem
+                suffix = 1
+                while stem.lower() in used_stems:
+                    stem = f"{base_stem}_{suffix}"
+                    suffix += 1
+                used_stems.add(stem.lower())
+                jobs.append((input_path, str(output_dir / (stem + ".avif"))))
+            filenames = {
+                os.path.abspath(input_path): filename
+                for input_path, filename in files_to_convert
+            }
+
+            def handle_result(result):
+                """處理單個文件的轉換結果並更新進度"""
+                filename = filenames.get(result["input"], os.path.basename(result["input"]))
+
+                # 更新統計
+                if result.get("success"):
+                    stats["success"] += 1
+                    if result.get("skipped"):
+                        stats["skipped"] += 1
+                    stats["original_size"] += result.get("originalSize", 0)
+                    stats["converted_size"] += result.get("convertedSize", 0)
+
+                    if result.get("outputPath"):
+                        output_file = Path(result["outputPath"])
+                        file_size = output_file.stat().st_size
+                        output_index.append(
+                            {
+                                "path": str(output_file.relative_to(output_dir)),
+                                "name": output_file.name,
+                                "size": file_size,
+                                "size_kb": file_size / 1024,
+                                "source": result["input"],
+                            }
                         )
-                        status_text.text(f"正在轉換: {filename}")
-
-                        # 處理上傳的文件
-                        if hasattr(file_info, "name"):
-                            # 保存上傳的文件到臨時位置
-                            temp_input_path = temp_dir / filename
-                            with open(temp_input_path, "wb") as f:
-                                f.write(file_info.getvalue())
-                            input_path = str(temp_input_path)
-                        else:
-                            input_path = file_info
-
-                        # 生成輸出路徑
-                        output_filename = filename.rsplit(".", 1)[0] + ".avif"
-                        output_path = str(output_dir / output_filename)
-
-                        # 調用轉換器
-                        result = convert_image_to_avif(
-                            input_path, output_path, quality, speed
-                        )
-
-                        # 更新統計
-                        if "error" not in result:
-                            stats["success"] += 1
-                            stats["original_size"] += result.get("originalSize", 0)
-                            stats["converted_size"] += result.get("convertedSize", 0)
-                        else:
-                            stats["failed"] += 1
-                            stats["errors"].append(f"{filename}: {result['error']}")
-
-                        # 更新進度
-                        progress = (i + 1) / len(files_to_convert)
-                        progress_bar.progress(progress)
-
-                    except Exception as e:
-                        stats["failed"] += 1
-                        filename = (
-                            file_info.name
-                            if hasattr(file_info, "name")
-                            else os.path.basename(file_info)
-                        )
-                        stats["errors"].append(f"{filename}: {str(e)}")
-
-                        # 更新進度
-                        progress = (i + 1) / len(files_to_convert)
-                        progress_bar.progress(progress)
-
-                # 計算最終統計
-                if stats["original_size"] > 0:
-                    stats["compression_ratio"] = (
-                        (stats["original_size"] - stats["converted_size"])
-                        / stats["original_size"]
-                    ) * 100
-                    stats["original_size_mb"] = stats["original_size"] / (1024 * 1024)
-                    stats["converted_size_mb"] = stats["converted_size"] / (1024 * 1024)
-
-                # 保存統計到session
-                st.session_state.conversion_stats = stats
-
-                # 顯示結果
-                status_text.text("轉換完成！")
-
-                if stats["failed"] == 0:
-                    st.success(f"✅ 所有 {stats['success']} 個文件轉換成功！")
                 else:
-                    st.warning(f"⚠️ {stats['success']} 個成功，{stats['failed']} 個失敗")
-
-                # 下載功能
-                from download_utils import (
-                    DownloadUtils,
-                    show_file_preview,
-                    provide_download_link,
+                    stats["failed"] += 1
+                    stats["errors"].append(f"{filename}: {result.get('error')}")
+
+                # 更新進度
+                done = stats["success"] + stats["failed"]
+                status_text.text(f"已完成: {filename} ({done}/{len(jobs)})")
+                progress_bar.progress(done / len(jobs))
+
+            # 整個文件列表在一次Node.js調用中並發轉換
+            status_text.text(f"正在轉換 {len(jobs)} 個文件...")
+            try:
+                batch_convert_files_to_avif(
+                    jobs,
+                    quality,
+                    speed,
+                    concurrent,
+                    max_width=max_width,
+                    max_height=max_height,
+                    max_megapixels=max_megapixels,
+                    fit=fit,
+                    size_guard=size_guard,
+                    on_result=handle_result,
                 )
-
-                st.markdown("### 📥 下載轉換後的文件")
-
-                # 顯示轉換摘要
-                summary = DownloadUtils.get_conversion_summary(str(output_dir))
-                if summary:
-                    st.markdown(
-                        f"""
-                    <div class="stats-card">
-                        <h4>轉換摘要</h4>
-                        <p>📁 轉換文件數: {summary["file_count"]}</p>
-                        <p>📦 總大小: {summary["total_size_mb"]:.2f} MB</p>
-                        <p>📂 目錄數: {summary["directory_count"]}</p>
-                    </div>
-                    """,
-                        unsafe_allow_html=True,
-                    )
-
-                # 文件預覽
-                show_file_preview(str(output_dir))
-
-                # 批量下載
-                st.markdown("### 📦 批量下載")
-
-                if stats["success"] > 0:
-                    # 創建ZIP文件
-                    zip_path = DownloadUtils.create_download_zip(str(output_dir))
-
-                    if zip_path:
-                        # 提供下載鏈接
-                        if provide_download_link(zip_path):
-                            st.success("✅ 下載鏈接已準備就緒！")
-                        else:
-                            st.error("❌ 下載鏈接創建失敗")
-                    else:
-                        st.warning("⚠️ 沒有找到轉換後的文件")
-                else:
-                    st.warning("⚠️ 沒有成功轉換的文件可供下載")
+            except Exception as e:
+                # 未返回結果的文件均記為失敗
+                remaining = len(jobs) - stats["success"] - stats["failed"]
+                stats["failed"] += remaining
+                stats["errors"].append(str(e))
+                progress_bar.progress(1.0)
+
+            # 計算最終統計
+            if stats["original_size"] > 0:
+                stats["compression_ratio"] = (
+                    (stats["original_size"] - stats["converted_size"])
+                    / stats["original_size"]
+                ) * 100
+                stats["original_size_mb"] = stats["original_size"] / (1024 * 1024)
+                stats["converted_size_mb"] = stats["converted_size"] / (1024 * 1024)
+
+            # 保存統計和輸出索引到session
+            st.session_state.conversion_stats = stats
+            st.session_state.output_index = sorted(output_index, key=lambda x: x["path"])
+            st.session_state.conversion_summary = DownloadUtils.get_conversion_summary(
+                str(output_dir)
+            )
+
+            # 顯示結果
+            status_text.text("轉換完成！")
+
+            if stats["failed"] == 0:
+                st.success(f"✅ 所有 {stats['success']} 個文件轉換成功！")
+            else:
+                st.warning(f"⚠️ {stats['success']} 個成功，{stats['failed']} 個失敗")
 
     else:
         st.warning("請先上傳圖片文件或選擇包含圖片的目錄")
 
+    # 下載功能，結果保存在session中，翻頁時無需重新轉換
+    if "output_index" in st.session_state:
+        st.markdown("### 📥 下載轉換後的文件")
+
+        # 顯示轉換摘要
+        summary = st.session_state.get("conversion_summary")
+        if summary:
+            st.markdown(
+                f"""
+            <div class="stats-card">
+                <h4>轉換摘要</h4>
+                <p>📁 轉換文件數: {summary["file_count"]}</p>
+                <p>📦 總大小: {summary["total_size_mb"]:.2f} MB</p>
+                <p>📂 目錄數: {summary["directory_count"]}</p>
+            </div>
+            """,
+                unsafe_allow_html=True,
+            )
+
+        # 文件預覽：縮略圖在後台生成，生成期間定時只刷新預覽片段
+        thumbnail_cache = st.session_state.thumbnail_cache
+        polling = thumbnail_cache.has_pending(st.session_state.get("preview_sources", []))
+
+        @st.fragment(run_every=1.0 if polling else None)
+        def render_file_preview():
+            sources = show_file_preview(
+                str(Path(st.session_state.workspace) / "output"),
+                file_list=st.session_state.output_index,
+                thumbnail_cache=thumbnail_cache,
+            )
+            st.session_state.preview_sources = sources
+            # 翻頁產生新任務或縮略圖全部完成時，重新運行整頁以開啟或停止定時刷新
+            if thumbnail_cache.has_pending(sources) != polling:
+                st.rerun()
+
+        render_file_preview()
+
+        # 批量下載：按需打包，避免每次頁面刷新都讀取整個ZIP
+        st.markdown("### 📦 批量下載")
+
+        if st.session_state.conversion_stats.get("success", 0) > 0:
+            if st.button("📦 打包下載", key="build_zip"):
+                with st.spinner("正在打包..."):
+                    zip_path = DownloadUtils.create_download_zip(
+                        str(Path(st.session_state.workspace) / "output"),
+                        target_dir=st.session_state.workspace,
+                    )
+                if not zip_path:
+                    st.warning("⚠️ 沒有找到轉換後的文件")
+                elif provide_download_link(zip_path):
+                    st.success("✅ 下載鏈接已準備就緒！")
+                else:
+                    st.error("❌ 下載鏈接創建失敗")
+        else:
+            st.warning("⚠️ 沒有成功轉換的文件可供下載")
+
 with col4:
     st.subheader("ℹ️ 使用說明")
     st.markdown(